@@ -1,22 +1,29 @@
 import asyncio
+import calendar
+import hashlib
+import heapq
 import json
+import queue
 import sqlite3
 import sys
 import threading
 import time
-from contextlib import asynccontextmanager
+from array import array
+from contextlib import asynccontextmanager, contextmanager
 from datetime import datetime, timezone
-import subprocess
-import requests
+from itertools import accumulate, chain, dropwhile, groupby, repeat
+from operator import itemgetter
+from typing import Iterable, Iterator, Optional
+import aiohttp
+import orjson
 import websockets
 from websockets.client import connect as ws_connect
 from websockets.exceptions import ConnectionClosedError, ConnectionClosedOK
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 
-# --- 确保依赖版本 ---
-# Dependencies are managed by requirements.txt in Docker environment.
-print("Dependencies are installed via requirements.txt.")
+# 依赖 (包括 websockets==10.4) 由 requirements.txt 在构建镜像时安装，运行时不再检查或安装
 
 # Windows asyncio 兼容处理
 if sys.platform == "win32" and sys.version_info >= (3, 8):
@@ -26,19 +33,362 @@ if sys.platform == "win32" and sys.version_info >= (3, 8):
 NEZHA_HOST = "nezha.goodnightan.com"
 WS_URL = f"wss://{NEZHA_HOST}/api/v1/ws/server"
 DB_FILE = "nezha_data.db"
+READER_POOL_SIZE = 4 # API 只读连接池大小
+STREAM_FETCH_ROWS = 1000 # 流式响应每次从游标取出、并作为一块输出的行数
+NEZHA_FETCH_CONCURRENCY = 16 # 同时请求 Nezha API 的最大数量
+ENABLE_PERIODIC_VACUUM = False # VACUUM 会重写整个数据库文件，默认关闭
+VACUUM_INTERVAL_RUNS = 90 # 开启后每清理多少次执行一次 VACUUM (每天清理一次，约为一个季度)
+
+# 每个连接都需要设置的 PRAGMA (journal_mode=WAL 会持久化到文件，在 init_db 中设置一次即可)
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL;",
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA cache_size=-64000;",
+    "PRAGMA mmap_size=268435456;",
+    "PRAGMA busy_timeout=5000;",
+)
+
+# --- 按天分区的表 ---
+# 数据实际存放在 <表名>_YYYYMMDD 子表中，同名视图以 UNION ALL 合并所有分区；
+# 清理旧数据时直接 DROP 过期分区，而不是逐行 DELETE。
+PARTITION_SCHEMAS = {
+    # --- 服务器状态监控信息 (server_state) ---
+    "server_state": """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        server_id INTEGER NOT NULL,
+        cpu_usage REAL,
+        mem_used INTEGER,
+        swap_used INTEGER,
+        disk_used INTEGER,
+        net_in_transfer INTEGER,
+        net_out_transfer INTEGER,
+        net_in_speed INTEGER,
+        net_out_speed INTEGER,
+        uptime INTEGER,
+        load_1 REAL,
+        load_5 REAL,
+        load_15 REAL,
+        tcp_conn_count INTEGER,
+        udp_conn_count INTEGER,
+        process_count INTEGER,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (server_id) REFERENCES servers(id) ON DELETE CASCADE
+    """,
+    # --- TCPING 历史记录 (tcping_history) ---
+    "tcping_history": """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        server_id INTEGER NOT NULL,
+        monitor_name TEXT,
+        avg_delay REAL,
+        created_at DATETIME NOT NULL,
+        created_at_ms INTEGER,
+        FOREIGN KEY (server_id) REFERENCES servers(id) ON DELETE CASCADE,
+        UNIQUE(server_id, monitor_name, created_at)
+    """,
+}
+# 后来新增的列：列名 -> (类型, 由已有数据回填的表达式)，旧分区在启动时补齐
+PARTITION_ADDED_COLUMNS = {
+    "server_state": {},
+    "tcping_history": {
+        "created_at_ms": ("INTEGER", "CAST(strftime('%s', created_at) AS INTEGER) * 1000"),
+    },
+}
+# 每个分区上创建的索引：索引名前缀 -> 列
+PARTITION_INDEXES = {
+    "server_state": {"idx_server_time": "server_id, created_at"},
+    "tcping_history": {
+        "idx_tcping_time": "server_id, created_at",
+        "idx_tcping_time_ms": "server_id, created_at_ms",
+    },
+}
+
+# --- 预定义的写入语句 ---
+# SQL 文本固定不变，sqlite3 的语句缓存才能命中，避免每次重新解析；分区表名按天替换 {partition}
+SERVER_COLUMNS = (
+    'id', 'name', 'display_index', 'platform', 'cpu', 'mem_total', 'swap_total', 'disk_total',
+    'arch', 'virtualization', 'boot_time', 'public_note', 'country_code', 'last_active',
+)
+STATE_COLUMNS = (
+    'server_id', 'cpu_usage', 'mem_used', 'swap_used', 'disk_used', 'net_in_transfer',
+    'net_out_transfer', 'net_in_speed', 'net_out_speed', 'uptime', 'load_1', 'load_5',
+    'load_15', 'tcp_conn_count', 'udp_conn_count', 'process_count', 'created_at',
+)
+INSERT_SERVER_SQL = (
+    f"INSERT OR REPLACE INTO servers ({', '.join(SERVER_COLUMNS)}) "
+    f"VALUES ({', '.join(['?'] * len(SERVER_COLUMNS))})"
+)
+INSERT_STATE_SQL = (
+    f"INSERT INTO {{partition}} ({', '.join(STATE_COLUMNS)}) "
+    f"VALUES ({', '.join(['?'] * len(STATE_COLUMNS))})"
+)
+# 静态信息未变化时只刷新 last_active
+UPDATE_LAST_ACTIVE_SQL = "UPDATE servers SET last_active = ? WHERE id = ?"
+# 每个服务器在某个 tcping_history 分区中的最新时间戳 (按 idx_tcping_time_ms 逐个探测)
+LATEST_TCPING_SQL = (
+    "SELECT s.id, (SELECT MAX(created_at_ms) FROM {partition} WHERE server_id = s.id) FROM servers s"
+)
+# 使用 INSERT OR IGNORE 避免因UNIQUE约束而报错；批量部分每条语句带 TCPING_INSERT_BATCH 组 VALUES
+TCPING_INSERT_BATCH = 100
+# 单个分区一次写入超过该行数时 (如首次回填)，先删除普通索引、写完后重建；UNIQUE 索引需保留给 OR IGNORE 使用
+TCPING_REINDEX_THRESHOLD = 5000
+INSERT_TCPING_SQL = (
+    "INSERT OR IGNORE INTO {partition} (server_id, monitor_name, avg_delay, created_at, created_at_ms) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+INSERT_TCPING_BATCH_SQL = (
+    "INSERT OR IGNORE INTO {partition} (server_id, monitor_name, avg_delay, created_at, created_at_ms) "
+    "VALUES " + ", ".join(["(?, ?, ?, ?, ?)"] * TCPING_INSERT_BATCH)
+)
+
+# --- 压缩存储 ---
+# 已封存 (早于 UTC 当天) 的 tcping_history 分区按 (server_id, monitor_name) 压缩为一行：
+# ts_blob 为距当天零点秒数的差分编码 (array('I'))，delay_blob 为对应延迟 (array('d'))。
+COMPRESSED_TCPING_TABLE = "tcping_history_compressed"
+COMPRESSED_TS_TYPECODE = "I"
+COMPRESSED_TS_ITEMSIZE = array(COMPRESSED_TS_TYPECODE).itemsize # ts_blob 中每个样本占用的字节数
 
 # --- 数据库 ---
-def get_db_connection():
-    """获取数据库连接"""
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
+def _apply_pragmas(conn: sqlite3.Connection) -> sqlite3.Connection:
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
     return conn
 
-def init_db():
+def get_writer_conn():
+    """获取写连接：自动提交模式 (写入时需显式 BEGIN/COMMIT)，返回普通元组，不做 Row 包装"""
+    conn = sqlite3.connect(DB_FILE, isolation_level=None, check_same_thread=False, cached_statements=256)
+    return _apply_pragmas(conn)
+
+def get_reader_conn():
+    """获取只读连接：结果行为 sqlite3.Row，便于 API 转换为 dict"""
+    conn = sqlite3.connect(f"file:{DB_FILE}?mode=ro", uri=True, isolation_level=None,
+                           check_same_thread=False, cached_statements=256)
+    conn.row_factory = sqlite3.Row
+    return _apply_pragmas(conn)
+
+@contextmanager
+def reader_connection():
+    """
+    从只读连接池借出一个连接，用完后归还。
+    流式响应会在整个输出期间占用连接，连接池耗尽时临时新建连接，避免在事件循环中阻塞等待。
+    """
+    try:
+        conn = app.state.reader_pool.get_nowait()
+    except queue.Empty:
+        conn = get_reader_conn()
+    try:
+        yield conn
+    finally:
+        try:
+            app.state.reader_pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+@asynccontextmanager
+async def writer_transaction():
+    """持有写锁并在长连接上开启事务：正常退出时提交，出错时回滚"""
+    async with app.state.writer_lock:
+        conn = app.state.writer_conn
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+def utc_day(ts: Optional[float] = None) -> str:
+    """返回 UTC 日期 YYYYMMDD (默认为当前时间)，用作分区后缀"""
+    return time.strftime('%Y%m%d', time.gmtime(ts))
+
+def list_partitions(conn: sqlite3.Connection, base: str) -> list[str]:
+    """按日期升序列出某个表的所有分区"""
+    rows = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ?",
+        (f"{base}_" + "[0-9]" * 8,)
+    ).fetchall()
+    return sorted(row[0] for row in rows)
+
+def _create_partition(conn: sqlite3.Connection, base: str, day: str) -> str:
+    partition = f"{base}_{day}"
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {partition} ({PARTITION_SCHEMAS[base]})")
+    for index, columns in PARTITION_INDEXES[base].items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {index}_{day} ON {partition}({columns})")
+    return partition
+
+def rebuild_partition_view(conn: sqlite3.Connection, base: str):
+    """重建合并所有分区的视图；没有分区时先创建当天的分区"""
+    partitions = list_partitions(conn, base) or [_create_partition(conn, base, utc_day())]
+    conn.execute(f"DROP VIEW IF EXISTS {base}")
+    conn.execute(f"CREATE VIEW {base} AS " + " UNION ALL ".join(f"SELECT * FROM {p}" for p in partitions))
+
+def ensure_partition(conn: sqlite3.Connection, base: str, day: str) -> str:
+    """返回指定日期的分区表名，不存在时创建并重建视图"""
+    partition = f"{base}_{day}"
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (partition,)
+    ).fetchone()
+    if not exists:
+        _create_partition(conn, base, day)
+        rebuild_partition_view(conn, base)
+    return partition
+
+def drop_partitions_before(conn: sqlite3.Connection, base: str, cutoff_ms: int) -> list[str]:
+    """删除在 cutoff_ms (毫秒时间戳) 之前已整天结束的分区并重建视图，返回被删除的分区"""
+    dropped = [p for p in list_partitions(conn, base) if (_day_start(p[-8:]) + 86400) * 1000 <= cutoff_ms]
+    for partition in dropped:
+        conn.execute(f"DROP TABLE {partition}")
+    if dropped:
+        rebuild_partition_view(conn, base)
+    return dropped
+
+def _migrate_to_partitions(conn: sqlite3.Connection, base: str):
+    """将旧版未分区的同名表按天拆分到分区中"""
+    legacy = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (base,)
+    ).fetchone()
+    if not legacy:
+        return
+    print(f"Migrating '{base}' into daily partitions...")
+    conn.execute(f"ALTER TABLE {base} RENAME TO {base}_legacy")
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({base}_legacy)")]
+    values = list(columns)
+    for column, (_, backfill) in PARTITION_ADDED_COLUMNS[base].items():
+        if column not in columns:
+            columns.append(column)
+            values.append(backfill)
+    days = conn.execute(f"SELECT DISTINCT substr(created_at, 1, 10) FROM {base}_legacy").fetchall()
+    for (day,) in days:
+        partition = _create_partition(conn, base, day.replace('-', ''))
+        conn.execute(
+            f"INSERT INTO {partition} ({', '.join(columns)}) SELECT {', '.join(values)} "
+            f"FROM {base}_legacy WHERE substr(created_at, 1, 10) = ?",
+            (day,)
+        )
+    conn.execute(f"DROP TABLE {base}_legacy")
+
+def _upgrade_partition(conn: sqlite3.Connection, base: str, partition: str):
+    """为旧版本创建的分区补齐后来新增的列和索引"""
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({partition})")}
+    for column, (column_type, backfill) in PARTITION_ADDED_COLUMNS[base].items():
+        if column not in columns:
+            conn.execute(f"ALTER TABLE {partition} ADD COLUMN {column} {column_type}")
+            conn.execute(f"UPDATE {partition} SET {column} = {backfill}")
+    _create_partition(conn, base, partition[-8:])
+
+def insert_tcping_records(conn: sqlite3.Connection, partition: str, records: list[tuple]):
+    """按 TCPING_INSERT_BATCH 行一组用多行 VALUES 插入，不足一组的尾部逐行插入"""
+    day = partition[-8:]
+    reindex = len(records) > TCPING_REINDEX_THRESHOLD
+    if reindex:
+        for index in PARTITION_INDEXES["tcping_history"]:
+            conn.execute(f"DROP INDEX IF EXISTS {index}_{day}")
+
+    batched = len(records) - len(records) % TCPING_INSERT_BATCH
+    if batched:
+        conn.executemany(
+            INSERT_TCPING_BATCH_SQL.format(partition=partition),
+            (tuple(chain.from_iterable(records[i:i + TCPING_INSERT_BATCH]))
+             for i in range(0, batched, TCPING_INSERT_BATCH))
+        )
+    if batched < len(records):
+        conn.executemany(INSERT_TCPING_SQL.format(partition=partition), records[batched:])
+
+    if reindex:
+        _create_partition(conn, "tcping_history", day)
+
+def _day_start(day: str) -> int:
+    """YYYY-MM-DD 或 YYYYMMDD 格式日期对应的 UTC 零点时间戳 (秒)"""
+    return calendar.timegm(time.strptime(day.replace('-', ''), '%Y%m%d'))
+
+def _decode_bucket_columns(bucket_date: str, ts_blob: bytes, delay_blob: bytes) -> tuple[Iterator[int], Iterable[float]]:
+    """将一行压缩数据解码为 (时间戳秒, 延迟) 两列"""
+    delays = array('d', delay_blob)
+    timestamps = accumulate(array(COMPRESSED_TS_TYPECODE, ts_blob), initial=_day_start(bucket_date))
+    next(timestamps) # 跳过当天零点
+    return timestamps, delays
+
+def decode_tcping_bucket(bucket_date: str, ts_blob: bytes, delay_blob: bytes) -> Iterator[tuple[int, float]]:
+    """解码一行压缩数据，按时间顺序产出 (时间戳秒, 延迟)"""
+    return zip(*_decode_bucket_columns(bucket_date, ts_blob, delay_blob))
+
+def encode_tcping_bucket(bucket_date: str, samples: list[tuple[int, float]]) -> tuple[bytes, bytes]:
+    """将 (时间戳秒, 延迟) 列表编码为 (ts_blob, delay_blob)；延迟按 float64 存储，与热数据的值完全一致"""
+    deltas, delays = array(COMPRESSED_TS_TYPECODE), array('d')
+    previous = _day_start(bucket_date)
+    for ts, delay in sorted(samples):
+        deltas.append(ts - previous)
+        delays.append(delay)
+        previous = ts
+    return deltas.tobytes(), delays.tobytes()
+
+def compress_partition(conn: sqlite3.Connection, partition: str) -> int:
+    """将一个已封存的 tcping_history 分区压缩进压缩表并删除该分区，返回写入的压缩行数"""
+    bucket_date = f"{partition[-8:-4]}-{partition[-4:-2]}-{partition[-2:]}"
+    buckets = {}
+    rows = conn.execute(f"""
+        SELECT server_id, monitor_name, CAST(strftime('%s', created_at) AS INTEGER), avg_delay
+        FROM {partition}
+    """)
+    for server_id, monitor_name, ts, delay in rows:
+        buckets.setdefault((server_id, monitor_name), {})[ts] = delay
+
+    for (server_id, monitor_name), samples in buckets.items():
+        # 分区被迟到的数据重新创建时，与已有的压缩行合并
+        existing = conn.execute(f"""
+            SELECT ts_blob, delay_blob FROM {COMPRESSED_TCPING_TABLE}
+            WHERE server_id = ? AND monitor_name IS ? AND bucket_date = ?
+        """, (server_id, monitor_name, bucket_date)).fetchone()
+        if existing:
+            for ts, delay in decode_tcping_bucket(bucket_date, *existing):
+                samples.setdefault(ts, delay)
+        ts_blob, delay_blob = encode_tcping_bucket(bucket_date, list(samples.items()))
+        conn.execute(f"""
+            INSERT OR REPLACE INTO {COMPRESSED_TCPING_TABLE}
+                (server_id, monitor_name, bucket_date, ts_blob, delay_blob, last_created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (server_id, monitor_name, bucket_date, ts_blob, delay_blob,
+              time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(max(samples)))))
+
+    conn.execute(f"DROP TABLE {partition}")
+    rebuild_partition_view(conn, "tcping_history")
+    return len(buckets)
+
+def load_compressed_tcping(conn: sqlite3.Connection, server_id: int, from_date: str) -> Iterator[dict]:
+    """
+    按时间顺序逐行解压指定服务器自 from_date (YYYY-MM-DD) 起的 TCPING 数据，行格式与 tcping_history 相同。
+    每次只解码一天的压缩行，同一天各监控项的数据按时间归并后产出。
+    """
+    cursor = conn.execute(f"""
+        SELECT bucket_date, monitor_name, ts_blob, delay_blob FROM {COMPRESSED_TCPING_TABLE}
+        WHERE server_id = ? AND bucket_date >= ?
+        ORDER BY bucket_date
+    """, (server_id, from_date))
+    for bucket_date, buckets in groupby(cursor, key=itemgetter(0)):
+        day_start = _day_start(bucket_date)
+        # 归并 (时间戳, 序号, 监控项, 延迟) 元组，比按 key 归并 dict 快；序号保证时间相同时不比较监控项 (可能为 NULL)
+        columns = [(monitor_name, *_decode_bucket_columns(bucket_date, ts_blob, delay_blob))
+                   for _, monitor_name, ts_blob, delay_blob in buckets]
+        samples = heapq.merge(*(zip(timestamps, repeat(index), repeat(monitor_name), delays)
+                                for index, (monitor_name, timestamps, delays) in enumerate(columns)))
+        for ts, _, monitor_name, delay in samples:
+            # 样本都在同一天内，直接由当天秒数拼出时间，比逐行 strftime 快
+            hours, seconds = divmod(ts - day_start, 3600)
+            minutes, seconds = divmod(seconds, 60)
+            yield {
+                'id': None, 'server_id': server_id, 'monitor_name': monitor_name, 'avg_delay': delay,
+                'created_at': f"{bucket_date}T{hours:02d}:{minutes:02d}:{seconds:02d}Z", 'created_at_ms': ts * 1000,
+            }
+
+def init_db(conn: sqlite3.Connection):
     """初始化数据库和表"""
     print("Initializing new database schema...")
-    with get_db_connection() as conn:
+    with conn:
+        # WAL 模式：提交只需一次 fsync，且读操作不会被写事务阻塞
+        conn.execute("PRAGMA journal_mode=WAL;")
+        # 只有写连接会触发自动检查点，调大间隔减少检查点次数；WAL 由定期清理任务截断
+        conn.execute("PRAGMA wal_autocheckpoint=10000;")
         cursor = conn.cursor()
+        cursor.execute("BEGIN")
         # --- 表1：服务器基础信息 (servers) ---
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS servers (
@@ -59,91 +409,100 @@ def init_db():
                 last_active DATETIME
             )
         """)
-        # --- 表2：服务器状态监控信息 (server_state) ---
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS server_state (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                server_id INTEGER NOT NULL,
-                cpu_usage REAL,
-                mem_used INTEGER,
-                swap_used INTEGER,
-                disk_used INTEGER,
-                net_in_transfer INTEGER,
-                net_out_transfer INTEGER,
-                net_in_speed INTEGER,
-                net_out_speed INTEGER,
-                uptime INTEGER,
-                load_1 REAL,
-                load_5 REAL,
-                load_15 REAL,
-                tcp_conn_count INTEGER,
-                udp_conn_count INTEGER,
-                process_count INTEGER,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (server_id) REFERENCES servers(id) ON DELETE CASCADE
-            )
-        """)
-        # --- 创建索引 ---
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_server_time ON server_state(server_id, created_at)")
-        
-        # --- 表3：TCPING 历史记录 (tcping_history) ---
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS tcping_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
+        # --- 表2/表3：server_state 与 tcping_history，按天分区 ---
+        for base in PARTITION_SCHEMAS:
+            _migrate_to_partitions(conn, base)
+            for partition in list_partitions(conn, base):
+                _upgrade_partition(conn, base, partition)
+            rebuild_partition_view(conn, base)
+        # --- 表4：按天压缩后的 TCPING 历史记录 ---
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {COMPRESSED_TCPING_TABLE} (
                 server_id INTEGER NOT NULL,
                 monitor_name TEXT,
-                avg_delay REAL,
-                created_at DATETIME NOT NULL,
-                FOREIGN KEY (server_id) REFERENCES servers(id) ON DELETE CASCADE,
-                UNIQUE(server_id, monitor_name, created_at)
+                bucket_date TEXT NOT NULL,
+                ts_blob BLOB NOT NULL,
+                delay_blob BLOB NOT NULL,
+                last_created_at DATETIME NOT NULL,
+                PRIMARY KEY (server_id, monitor_name, bucket_date)
             )
         """)
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tcping_time ON tcping_history(server_id, created_at)")
         conn.commit()
     print("Database initialized with 'servers', 'server_state', and 'tcping_history' tables.")
 
 
 # --- 新增：获取并存储 TCPING 历史数据 ---
+async def fetch_service_history(session: aiohttp.ClientSession, sem: asyncio.Semaphore,
+                                server_id: int, start_ts: int, end_ts: int):
+    """请求单个服务器的 TCPING 历史数据，返回 (server_id, 监控项列表)"""
+    api_url = f"https://{NEZHA_HOST}/api/v1/service/{server_id}?start={start_ts}&end={end_ts}"
+    async with sem:
+        async with session.get(api_url, timeout=aiohttp.ClientTimeout(total=15)) as response:
+            response.raise_for_status()
+            response_data = await response.json(loads=orjson.loads)
+    return server_id, response_data.get("data", [])
+
 async def fetch_and_store_tcping_history():
     """
     从 Nezha API 获取所有服务器的 TCPING 历史数据并存入数据库。
     改为增量更新，以避免重复获取并解决数据点限制问题。
+    各服务器的请求并发执行，结果在一个事务中批量写入。
     """
     print("Starting to fetch TCPING history for all servers (incremental update)...")
     try:
-        with get_db_connection() as conn:
-            server_rows = conn.execute("SELECT id FROM servers").fetchall()
-            server_ids = [row['id'] for row in server_rows]
+        conn = app.state.writer_conn
+        async with app.state.writer_lock:
+            # 1. 一条查询同时取出所有服务器及其在最新分区中的最新时间戳
+            partitions = list_partitions(conn, "tcping_history")
+            rows = conn.execute(LATEST_TCPING_SQL.format(partition=partitions[-1])).fetchall()
+            server_ids = [sid for sid, _ in rows]
+            last_timestamps = {sid: last_ts for sid, last_ts in rows if last_ts is not None}
+            # 最新分区中没有记录的服务器 (很少见)，再往前面的分区查找，全部找到即停止
+            for partition in reversed(partitions[:-1]):
+                if len(last_timestamps) >= len(server_ids):
+                    break
+                for sid, last_ts in conn.execute(LATEST_TCPING_SQL.format(partition=partition)):
+                    if last_ts is not None:
+                        last_timestamps.setdefault(sid, last_ts)
+            if len(last_timestamps) < len(server_ids):
+                # 热数据中没有记录的服务器，再从压缩表中查找
+                rows = conn.execute(f"""
+                    SELECT server_id, CAST(strftime('%s', MAX(last_created_at)) AS INTEGER) * 1000
+                    FROM {COMPRESSED_TCPING_TABLE} GROUP BY server_id
+                """).fetchall()
+                for sid, last_ts in rows:
+                    last_timestamps.setdefault(sid, last_ts)
 
         end_ts = int(time.time() * 1000)
 
+        # 2. 计算每个服务器的起始时间
+        start_timestamps = {}
         for server_id in server_ids:
+            last_ts_ms = last_timestamps.get(server_id)
+            if last_ts_ms:
+                # 从最后一个时间点之后的一秒开始获取，避免重复
+                start_timestamps[server_id] = last_ts_ms + 1000 # 加1秒
+            else:
+                # 如果没有数据，则获取过去24小时
+                start_timestamps[server_id] = end_ts - (24 * 3600 * 1000)
+
+        # 3. 并发调用API，由信号量限制同时进行的请求数；复用全局会话的 keep-alive 连接
+        sem = asyncio.Semaphore(NEZHA_FETCH_CONCURRENCY)
+        session = app.state.http_session
+        results = await asyncio.gather(
+            *(fetch_service_history(session, sem, server_id, start_timestamps[server_id], end_ts)
+              for server_id in server_ids),
+            return_exceptions=True,
+        )
+
+        # 所有服务器、所有监控项的记录先收集起来，最后在一个事务中写入
+        all_records: list[tuple] = []
+
+        for server_id, result in zip(server_ids, results):
             try:
-                # 1. 查找该服务器最新的时间戳
-                with get_db_connection() as conn:
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        "SELECT MAX(created_at) FROM tcping_history WHERE server_id = ?",
-                        (server_id,)
-                    )
-                    last_timestamp_str = cursor.fetchone()[0]
-
-                # 2. 计算起始时间
-                if last_timestamp_str:
-                    # 从最后一个时间点之后的一秒开始获取，避免重复
-                    last_dt = datetime.fromisoformat(last_timestamp_str.replace('Z', '+00:00'))
-                    start_ts = int(last_dt.timestamp() * 1000) + 1000 # 加1秒
-                else:
-                    # 如果没有数据，则获取过去24小时
-                    start_ts = end_ts - (24 * 3600 * 1000)
-
-                # 3. 调用API
-                api_url = f"https://{NEZHA_HOST}/api/v1/service/{server_id}?start={start_ts}&end={end_ts}"
-                response = await asyncio.to_thread(requests.get, api_url, timeout=15)
-                response.raise_for_status()
-                
-                response_data = response.json()
-                monitors = response_data.get("data", [])
+                if isinstance(result, BaseException):
+                    raise result
+                _, monitors = result
                 if not monitors:
                     continue
 
@@ -155,31 +514,30 @@ async def fetch_and_store_tcping_history():
                     if not timestamps or not delays or len(timestamps) != len(delays):
                         continue
 
-                    records_to_insert = []
                     for ts, delay in zip(timestamps, delays):
                         if delay is None: continue # 跳过空值
                         # 时间戳是毫秒，转换为ISO 8601格式的字符串 (UTC)
                         dt_object = datetime.fromtimestamp(ts / 1000, tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
-                        records_to_insert.append((server_id, monitor_name, delay, dt_object))
-
-                    if records_to_insert:
-                        with get_db_connection() as conn:
-                            cursor = conn.cursor()
-                            # 使用 INSERT OR IGNORE 避免因UNIQUE约束而报错
-                            cursor.executemany("""
-                                INSERT OR IGNORE INTO tcping_history (server_id, monitor_name, avg_delay, created_at)
-                                VALUES (?, ?, ?, ?)
-                            """, records_to_insert)
-                            conn.commit()
-                            print(f"Upserted {len(records_to_insert)} TCPING records for server {server_id} from monitor '{monitor_name}'.")
-
-            except requests.RequestException as e:
-                print(f"Failed to fetch TCPING history for server {server_id}: {e}")
+                        all_records.append((server_id, monitor_name, delay, dt_object, ts))
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"Failed to fetch TCPING history for server {server_id}: {e!r}")
             except (json.JSONDecodeError, KeyError) as e:
                 print(f"Failed to parse TCPING JSON for server {server_id}: {e}")
             except Exception as e:
                 print(f"An error occurred processing TCPING history for server {server_id}: {e!r}")
-        
+
+        # 4. 一次事务批量写入，每个周期只提交一次；记录按日期写入对应的分区
+        if all_records:
+            records_by_day = {}
+            for record in all_records:
+                records_by_day.setdefault(record[3][:10].replace('-', ''), []).append(record)
+            async with writer_transaction() as conn:
+                for day, records in records_by_day.items():
+                    partition = ensure_partition(conn, "tcping_history", day)
+                    insert_tcping_records(conn, partition, records)
+            print(f"Upserted {len(all_records)} TCPING records for {len(server_ids)} servers.")
+
         print("Finished fetching TCPING history.")
 
     except Exception as e:
@@ -194,28 +552,61 @@ app.add_middleware(
 )
 
 # --- 新增：清理旧数据 ---
-def cleanup_old_data(days_to_keep: int = 7):
-    """清理指定天数之前的旧的监控数据"""
+async def cleanup_old_data(days_to_keep: int = 7, vacuum: bool = False):
+    """清理指定天数之前的旧的监控数据，并截断 WAL 文件；vacuum 为 True 时额外执行 VACUUM"""
     print(f"Starting cleanup of data older than {days_to_keep} days...")
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cutoff_date = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(time.time() - days_to_keep * 86400))
-            
-            # 清理 server_state 表
-            cursor.execute("DELETE FROM server_state WHERE created_at < ?", (cutoff_date,))
-            print(f"Cleaned up {cursor.rowcount} old records from server_state.")
-
-            # 清理 tcping_history 表
-            cursor.execute("DELETE FROM tcping_history WHERE created_at < ?", (cutoff_date,))
-            print(f"Cleaned up {cursor.rowcount} old records from tcping_history.")
-            
-            conn.commit()
+        # 截止时间只计算一次，之后都是整数比较
+        cutoff_ms = int((time.time() - days_to_keep * 86400) * 1000)
+        async with writer_transaction() as conn:
+            # 直接删除整天的过期分区 (server_state 与 tcping_history)
+            for base in PARTITION_SCHEMAS:
+                dropped = drop_partitions_before(conn, base, cutoff_ms)
+                print(f"Dropped {len(dropped)} old partitions from {base}.")
+                if base == "server_state" and dropped:
+                    invalidate_servers_cache()
+
+            # 清理压缩表 (同样只删除在截止时间之前已整天结束的日期)
+            cursor = conn.execute(
+                f"DELETE FROM {COMPRESSED_TCPING_TABLE} WHERE bucket_date < ?",
+                (time.strftime('%Y-%m-%d', time.gmtime(cutoff_ms // 1000)),)
+            )
+            print(f"Cleaned up {cursor.rowcount} old records from {COMPRESSED_TCPING_TABLE}.")
+
+        # 检查点与 VACUUM 不能在事务中执行
+        async with app.state.writer_lock:
+            conn = app.state.writer_conn
+            busy, wal_pages, _ = conn.execute("PRAGMA wal_checkpoint(TRUNCATE);").fetchone()
+            print(f"WAL checkpoint finished (busy={busy}, pages={wal_pages}).")
+            if vacuum:
+                conn.execute("VACUUM")
+                print("Database vacuumed.")
         print("Database cleanup finished.")
     except Exception as e:
         print(f"An error occurred during database cleanup: {e!r}")
 
 
+def invalidate_servers_cache():
+    """servers / server_state 提交写入后调用，使 /api/servers 的缓存与 ETag 失效"""
+    app.state.servers_version += 1
+    app.state.servers_cache = None
+
+# --- 压缩已封存的 TCPING 数据 ---
+async def compress_old_data():
+    """将 UTC 当天之前的 tcping_history 分区压缩存储"""
+    print("Starting compression of sealed TCPING partitions...")
+    try:
+        today = utc_day()
+        async with writer_transaction() as conn:
+            for partition in list_partitions(conn, "tcping_history"):
+                if partition[-8:] < today:
+                    count = compress_partition(conn, partition)
+                    print(f"Compressed {partition} into {count} rows.")
+        print("TCPING compression finished.")
+    except Exception as e:
+        print(f"An error occurred during TCPING compression: {e!r}")
+
+
 # --- WebSocket 数据处理 ---
 async def fetch_nezha_ws():
     headers = {}
@@ -223,49 +614,56 @@ async def fetch_nezha_ws():
         async with ws_connect(WS_URL, extra_headers=headers) as ws:
             print("Connected to Nezha WebSocket.")
             message = await ws.recv()
-            data = json.loads(message)
+            data = orjson.loads(message)
 
             if "servers" in data:
                 sorted_servers = sorted(data["servers"], key=lambda x: x.get('display_index', 0))
-                with get_db_connection() as conn:
-                    cursor = conn.cursor()
-                    cursor.execute("BEGIN")
-                    for server in sorted_servers:
-                        host = server.get('host', {})
-                        state = server.get('state', {})
-                        
-                        # --- 1. 插入或替换服务器静态信息到 `servers` 表 ---
-                        server_info = {
-                            'id': server.get('id'), 'name': server.get('name'),
-                            'display_index': server.get('display_index', 0),
-                            'platform': host.get('platform'), 'cpu': json.dumps(host.get('cpu')),
-                            'mem_total': host.get('mem_total'), 'swap_total': host.get('swap_total'),
-                            'disk_total': host.get('disk_total'), 'arch': host.get('arch'),
-                            'virtualization': host.get('virtualization'), 'boot_time': host.get('boot_time'),
-                            'public_note': server.get('public_note'), 'country_code': server.get('country_code'),
-                            'last_active': server.get('last_active')
-                        }
-                        s_cols = ', '.join(server_info.keys())
-                        s_placeholders = ', '.join(['?'] * len(server_info))
-                        cursor.execute(f"INSERT OR REPLACE INTO servers ({s_cols}) VALUES ({s_placeholders})", tuple(server_info.values()))
-
-                        # --- 2. 插入新的服务器动态状态到 `server_state` 表 ---
-                        state_info = {
-                            'server_id': server.get('id'), 'cpu_usage': state.get('cpu'),
-                            'mem_used': state.get('mem_used'), 'swap_used': state.get('swap_used'),
-                            'disk_used': state.get('disk_used'), 'net_in_transfer': state.get('net_in_transfer'),
-                            'net_out_transfer': state.get('net_out_transfer'), 'net_in_speed': state.get('net_in_speed'),
-                            'net_out_speed': state.get('net_out_speed'), 'uptime': state.get('uptime'),
-                            'load_1': state.get('load_1'), 'load_5': state.get('load_5'),
-                            'load_15': state.get('load_15'), 'tcp_conn_count': state.get('tcp_conn_count'),
-                            'udp_conn_count': state.get('udp_conn_count'), 'process_count': state.get('process_count')
-                        }
-                        st_cols = ', '.join(state_info.keys())
-                        st_placeholders = ', '.join(['?'] * len(state_info))
-                        cursor.execute(f"INSERT INTO server_state ({st_cols}) VALUES ({st_placeholders})", tuple(state_info.values()))
+                # 显式写入 created_at，保证记录与其所在分区的日期一致
+                now = time.time()
+                created_at = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(now))
+                # 在事务外先构建好所有参数行，持有写锁期间只执行批量写入
+                server_rows, active_rows, state_rows = [], [], []
+                static_hashes = {}
+                for server in sorted_servers:
+                    host = server.get('host', {})
+                    state = server.get('state', {})
                     
-                    conn.commit()
-                    print(f"Updated {len(sorted_servers)} servers and their states in the database.")
+                    # --- 1. 插入或替换服务器静态信息到 `servers` 表 (顺序与 SERVER_COLUMNS 一致) ---
+                    server_row = (
+                        server.get('id'), server.get('name'), server.get('display_index', 0),
+                        host.get('platform'), json.dumps(host.get('cpu')),
+                        host.get('mem_total'), host.get('swap_total'), host.get('disk_total'),
+                        host.get('arch'), host.get('virtualization'), host.get('boot_time'),
+                        server.get('public_note'), server.get('country_code'), server.get('last_active'),
+                    )
+                    # 静态信息与上次相同则跳过整行替换；last_active 每次都会变化，不计入哈希
+                    digest = hashlib.blake2b(repr(server_row[:-1]).encode(), digest_size=16).digest()
+                    if app.state.server_static_hashes.get(server_row[0]) == digest:
+                        active_rows.append((server_row[-1], server_row[0]))
+                    else:
+                        server_rows.append(server_row)
+                        static_hashes[server_row[0]] = digest
+
+                    # --- 2. 插入新的服务器动态状态到 `server_state` 表 (顺序与 STATE_COLUMNS 一致) ---
+                    state_rows.append((
+                        server.get('id'), state.get('cpu'), state.get('mem_used'), state.get('swap_used'),
+                        state.get('disk_used'), state.get('net_in_transfer'), state.get('net_out_transfer'),
+                        state.get('net_in_speed'), state.get('net_out_speed'), state.get('uptime'),
+                        state.get('load_1'), state.get('load_5'), state.get('load_15'),
+                        state.get('tcp_conn_count'), state.get('udp_conn_count'), state.get('process_count'),
+                        created_at,
+                    ))
+
+                async with writer_transaction() as conn:
+                    state_partition = ensure_partition(conn, "server_state", utc_day(now))
+                    cursor = conn.cursor()
+                    cursor.executemany(INSERT_SERVER_SQL, server_rows)
+                    cursor.executemany(UPDATE_LAST_ACTIVE_SQL, active_rows)
+                    cursor.executemany(INSERT_STATE_SQL.format(partition=state_partition), state_rows)
+                print(f"Updated {len(sorted_servers)} servers ({len(server_rows)} with changed info) and their states in the database.")
+                # 事务提交成功后再记录哈希，并使 /api/servers 的缓存失效
+                app.state.server_static_hashes.update(static_hashes)
+                invalidate_servers_cache()
 
     except (ConnectionClosedError, ConnectionClosedOK, ConnectionRefusedError) as e:
         print(f"[WebSocket] Connection closed: {e}")
@@ -284,68 +682,173 @@ async def periodic_tcping_task(interval=30):
         await fetch_and_store_tcping_history()
         await asyncio.sleep(interval)
 
+async def periodic_compression_task(interval=3600):
+    """定期压缩已封存的 TCPING 分区，默认为一小时一次"""
+    while True:
+        await compress_old_data()
+        await asyncio.sleep(interval)
+
 async def periodic_cleanup_task(interval=86400):
     """定期清理旧数据，默认为一天一次"""
+    runs = 0
     while True:
-        cleanup_old_data(days_to_keep=7) # 保留最近7天的数据
+        runs += 1
+        vacuum = ENABLE_PERIODIC_VACUUM and runs % VACUUM_INTERVAL_RUNS == 0
+        await cleanup_old_data(days_to_keep=7, vacuum=vacuum) # 保留最近7天的数据
         await asyncio.sleep(interval)
 
 # --- FastAPI 生命周期 ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    init_db()
-    asyncio.create_task(periodic_ws_task(600)) # 10分钟一次
-    asyncio.create_task(periodic_tcping_task(30)) # 30秒一次
-    asyncio.create_task(periodic_cleanup_task(86400)) # 每天清理一次
+    # 后台任务共用一个长连接写库，由锁串行化；API 使用只读连接池
+    app.state.writer_conn = get_writer_conn()
+    app.state.writer_lock = asyncio.Lock()
+    app.state.server_static_hashes = {} # server_id -> 上次写入的静态信息哈希
+    # /api/servers 的响应缓存：数据只在 WS 写入后变化；ETag 带上启动时间，避免重启后版本号重复
+    app.state.servers_epoch = format(time.time_ns(), "x")
+    app.state.servers_version = 0
+    app.state.servers_cache = None
+    init_db(app.state.writer_conn)
+    app.state.reader_pool = queue.Queue(maxsize=READER_POOL_SIZE)
+    for _ in range(READER_POOL_SIZE):
+        app.state.reader_pool.put(get_reader_conn())
+    # 请求 Nezha API 的全局会话：连接保持时间长于 TCPING 周期，各周期共用同一批 TCP/TLS 连接
+    app.state.http_session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=NEZHA_FETCH_CONCURRENCY, keepalive_timeout=60)
+    )
+
+    tasks = [
+        asyncio.create_task(periodic_ws_task(600)), # 10分钟一次
+        asyncio.create_task(periodic_tcping_task(30)), # 30秒一次
+        asyncio.create_task(periodic_compression_task(3600)), # 每小时压缩一次
+        asyncio.create_task(periodic_cleanup_task(86400)), # 每天清理一次
+    ]
     
     # 启动时立即获取和清理一次
     await fetch_nezha_ws()
     await fetch_and_store_tcping_history()
-    cleanup_old_data(days_to_keep=7)
+    await compress_old_data()
+    await cleanup_old_data(days_to_keep=7)
     yield
 
+    # 先停止后台任务 (进行中的写事务会回滚)，再关闭它们共用的会话与连接
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await app.state.http_session.close()
+    while not app.state.reader_pool.empty():
+        app.state.reader_pool.get_nowait().close()
+    app.state.writer_conn.close()
+
 app.router.lifespan_context = lifespan
 
 # --- API 端点 ---
 @app.get("/api/servers")
-async def get_servers():
-    with get_db_connection() as conn:
-        # 使用 LEFT JOIN 和子查询获取每个服务器的最新状态
-        query = """
-            SELECT s.*, st.*
-            FROM servers s
-            LEFT JOIN (
-                SELECT *
-                FROM server_state
-                WHERE (server_id, created_at) IN (
-                    SELECT server_id, MAX(created_at)
-                    FROM server_state
-                    GROUP BY server_id
-                )
-            ) st ON s.id = st.server_id
-            ORDER BY s.display_index;
-        """
-        rows = conn.execute(query).fetchall()
-        servers_list = [dict(row) for row in rows]
-        return {"servers": servers_list}
+async def get_servers(request: Request):
+    """
+    获取所有服务器及其最新状态。
+    结果按数据版本缓存为 JSON 字节串，并以 ETag 支持条件请求。
+    """
+    etag = f'"{app.state.servers_epoch}-{app.state.servers_version}"'
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(","))):
+        return Response(status_code=304, headers={"ETag": etag})
+    if app.state.servers_cache is None:
+        app.state.servers_cache = orjson.dumps({"servers": load_servers()})
+    return Response(content=app.state.servers_cache, media_type="application/json", headers={"ETag": etag})
+
+def load_servers() -> list:
+    """查询所有服务器，并附上各自的最新状态"""
+    with reader_connection() as conn:
+        servers = conn.execute("SELECT * FROM servers ORDER BY display_index").fetchall()
+        # 关联条件无法下推到 UNION ALL 视图的各分区，因此按分区从新到旧查找每个服务器的最新状态；
+        # 最新状态几乎总在最新的分区中，全部找到即停止
+        latest_states = {}
+        state_columns = []
+        for partition in reversed(list_partitions(conn, "server_state")):
+            # 子查询按 idx_server_time 倒序取一行，只触及每个服务器的最新记录
+            cursor = conn.execute(f"""
+                SELECT st.*
+                FROM servers s
+                JOIN {partition} st ON st.id = (
+                    SELECT id
+                    FROM {partition}
+                    WHERE server_id = s.id
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT 1
+                );
+            """)
+            state_columns = [column[0] for column in cursor.description]
+            for row in cursor:
+                latest_states.setdefault(row['server_id'], row)
+            if len(latest_states) >= len(servers):
+                break
+
+        # 与 `SELECT s.*, st.*` 的结果保持一致：同名列以 servers 表为准，没有状态时填 None
+        servers_list = []
+        for server in servers:
+            item = dict(server)
+            state = latest_states.get(server['id'])
+            for column in state_columns:
+                item.setdefault(column, state[column] if state else None)
+            servers_list.append(item)
+        return servers_list
+
+def iter_row_dicts(cursor: sqlite3.Cursor) -> Iterator[dict]:
+    """按 STREAM_FETCH_ROWS 分批从游标取出结果，逐行转换为 dict"""
+    while True:
+        rows = cursor.fetchmany(STREAM_FETCH_ROWS)
+        if not rows:
+            return
+        for row in rows:
+            yield dict(row)
+
+def merge_tcping_rows(hot_rows: Iterable[dict], compressed_rows: Iterable[dict]) -> Iterator[dict]:
+    """
+    按时间合并热数据与已压缩的数据 (两者均已按 created_at 升序)。
+    迟到的数据可能尚未合并进压缩行，同一时间点、同一监控项只输出一次。
+    """
+    current, seen = None, set()
+    for row in heapq.merge(hot_rows, compressed_rows, key=itemgetter('created_at')):
+        if row['created_at'] != current:
+            current, seen = row['created_at'], set()
+        if row['monitor_name'] in seen:
+            continue
+        seen.add(row['monitor_name'])
+        yield row
+
+def stream_json_data(rows: Iterable[dict]) -> Iterator[bytes]:
+    """以 {"data": [...]} 格式流式输出 JSON，每 STREAM_FETCH_ROWS 行输出一块"""
+    yield b'{"data":['
+    chunk, separator = [], b''
+    for row in rows:
+        chunk.append(orjson.dumps(row))
+        if len(chunk) >= STREAM_FETCH_ROWS:
+            yield separator + b','.join(chunk)
+            chunk, separator = [], b','
+    if chunk:
+        yield separator + b','.join(chunk)
+    yield b']}'
 
 @app.get("/api/service/{server_id}")
 async def get_service_history(server_id: int):
     """
     获取指定服务器的历史状态数据，用于图表展示。
     """
-    with get_db_connection() as conn:
-        query = """
-            SELECT * FROM server_state
-            WHERE server_id = ? AND created_at >= strftime('%Y-%m-%dT%H:%M:%SZ', 'now', '-24 hours')
-            ORDER BY created_at ASC;
-        """
-        rows = conn.execute(query, (server_id,)).fetchall()
-        history_list = [dict(row) for row in rows]
-        return {"data": history_list}
+    def generate():
+        # 连接在整个输出期间保持借出，生成器结束 (或客户端断开被关闭) 时归还
+        with reader_connection() as conn:
+            query = """
+                SELECT * FROM server_state
+                WHERE server_id = ? AND created_at >= strftime('%Y-%m-%dT%H:%M:%SZ', 'now', '-24 hours')
+                ORDER BY created_at ASC;
+            """
+            cursor = conn.execute(query, (server_id,))
+            yield from stream_json_data(iter_row_dicts(cursor))
+
+    return StreamingResponse(generate(), media_type="application/json")
 
 from fastapi import Query
-from typing import Optional
 
 @app.get("/api/tcping/{server_id}")
 async def get_tcping_history(server_id: int, since: Optional[str] = Query(None)):
@@ -353,27 +856,38 @@ async def get_tcping_history(server_id: int, since: Optional[str] = Query(None))
     获取指定服务器的 TCPING 历史数据。
     支持 `since` 查询参数，用于增量获取。
     """
-    with get_db_connection() as conn:
-        if since:
-            # 如果提供了 `since` 参数，则只获取该时间之后的数据
-            query = """
-                SELECT * FROM tcping_history
-                WHERE server_id = ? AND created_at > ?
-                ORDER BY created_at ASC;
-            """
-            rows = conn.execute(query, (server_id, since)).fetchall()
-            history_list = [dict(row) for row in rows]
-        else:
-            # 否则，获取过去24小时的数据 (使用更健壮的 strftime)
-            query = """
-                SELECT * FROM tcping_history
-                WHERE server_id = ? AND created_at >= strftime('%Y-%m-%dT%H:%M:%SZ', 'now', '-24 hours')
-                ORDER BY created_at ASC;
-            """
-            rows = conn.execute(query, (server_id,)).fetchall()
-            history_list = [dict(row) for row in rows]
-        
-        return {"data": history_list}
+    def generate():
+        with reader_connection() as conn:
+            if since:
+                # 如果提供了 `since` 参数，则只获取该时间之后的数据
+                compressed = dropwhile(lambda row: row['created_at'] <= since,
+                                       load_compressed_tcping(conn, server_id, since[:10]))
+                query = """
+                    SELECT * FROM tcping_history
+                    WHERE server_id = ? AND created_at > ?
+                    ORDER BY created_at ASC;
+                """
+                cursor = conn.execute(query, (server_id, since))
+            else:
+                # 否则，获取过去24小时的数据 (使用更健壮的 strftime)
+                start = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(time.time() - 24 * 3600))
+                compressed = dropwhile(lambda row: row['created_at'] < start,
+                                       load_compressed_tcping(conn, server_id, start[:10]))
+                query = """
+                    SELECT * FROM tcping_history
+                    WHERE server_id = ? AND created_at >= strftime('%Y-%m-%dT%H:%M:%SZ', 'now', '-24 hours')
+                    ORDER BY created_at ASC;
+                """
+                cursor = conn.execute(query, (server_id,))
+
+            # 压缩数据按时间顺序逐行解压，与热数据边读边合并；没有压缩数据时直接输出热数据
+            rows = iter_row_dicts(cursor)
+            first = next(compressed, None)
+            if first is not None:
+                rows = merge_tcping_rows(rows, chain((first,), compressed))
+            yield from stream_json_data(rows)
+
+    return StreamingResponse(generate(), media_type="application/json")
 
 # --- 启动入口 ---
 if __name__ == "__main__":
@@ -13,17 +13,22 @@ def read_database_content():
         conn = sqlite3.connect(DB_FILE)
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
+        cursor.arraysize = 256 # fetchmany 每批读取的行数，避免大表一次性载入内存
 
         print("--- Reading 'servers' table (Static Info) ---")
         cursor.execute("SELECT * FROM servers ORDER BY display_index")
-        servers = cursor.fetchall()
-        if not servers:
-            print("  No data found in 'servers' table.")
-        else:
+        found = False
+        while True:
+            servers = cursor.fetchmany()
+            if not servers:
+                break
+            found = True
             for server in servers:
                 print(f"\n  [Server ID: {server['id']}] Name: {server['name']}")
                 for key, value in dict(server).items():
                     print(f"    - {key}: {value}")
+        if not found:
+            print("  No data found in 'servers' table.")
 
         print("\n--- Reading 'server_state' table (Last 5 states) ---")
         cursor.execute("SELECT * FROM server_state ORDER BY created_at DESC LIMIT 5")
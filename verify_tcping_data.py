@@ -1,4 +1,10 @@
+import os
 import sqlite3
+import sys
+
+# 压缩表的表名与 BLOB 编码以后端定义为准
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from main import COMPRESSED_TCPING_TABLE, COMPRESSED_TS_ITEMSIZE
 
 DB_FILE = "backend/nezha_data.db"
 
@@ -9,23 +15,50 @@ def view_tcping_data():
         conn = sqlite3.connect(DB_FILE)
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
+        cursor.arraysize = 256 # fetchmany 每批读取的行数，避免大表一次性载入内存
 
-        print("\n--- Checking for 'tcping_history' table ---")
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='tcping_history';")
+        # tcping_history 是合并各天分区 (tcping_history_YYYYMMDD) 的视图
+        print("\n--- Checking for 'tcping_history' view ---")
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name='tcping_history';")
         if not cursor.fetchone():
             print("Error: Table 'tcping_history' not found in the database.")
             return
 
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name GLOB 'tcping_history_[0-9]*' ORDER BY name;")
+        partitions = [row['name'] for row in cursor.fetchall()]
+        print(f"Found {len(partitions)} partitions: {', '.join(partitions)}")
+        print(f"Note: days before today (UTC) are moved into '{COMPRESSED_TCPING_TABLE}' and are no longer in the view.")
+
         print("\n--- Fetching first 10 rows from 'tcping_history' ---")
         cursor.execute("SELECT * FROM tcping_history LIMIT 10;")
-        rows = cursor.fetchall()
+        count = 0
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                break
+            for row in rows:
+                print(dict(row))
+            count += len(rows)
 
-        if not rows:
+        if not count:
             print("No data found in 'tcping_history' table.")
         else:
-            print(f"Found {len(rows)} records:")
+            print(f"Found {count} records.")
+
+        print(f"\n--- Summary of '{COMPRESSED_TCPING_TABLE}' (one row per server, monitor and day) ---")
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?;", (COMPRESSED_TCPING_TABLE,))
+        if not cursor.fetchone():
+            print(f"Table '{COMPRESSED_TCPING_TABLE}' not found in the database.")
+        else:
+            cursor.execute(f"""
+                SELECT bucket_date, COUNT(*) AS buckets, SUM(LENGTH(ts_blob)) / ? AS samples
+                FROM {COMPRESSED_TCPING_TABLE} GROUP BY bucket_date ORDER BY bucket_date;
+            """, (COMPRESSED_TS_ITEMSIZE,))
+            rows = cursor.fetchall()
+            if not rows:
+                print(f"No data found in '{COMPRESSED_TCPING_TABLE}' table.")
             for row in rows:
-                print(dict(row))
+                print(f"  {row['bucket_date']}: {row['buckets']} buckets, {row['samples']} samples")
 
     except sqlite3.Error as e:
         print(f"Database error: {e}")